@@ -1,17 +1,26 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 from datetime import datetime, timezone
 import pandas as pd
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import numpy as np
 import plotly.express as px
 
+# =====================================
+# ⚙️ KONFIGURASI DASAR
+# =====================================
+st.set_page_config(page_title="Tactical Weather Ops — BMKG", layout="wide")
+
 # =====================================
 # 🌑 CSS — MILITARY STYLE + RADAR ANIMATION
 # =====================================
-st.markdown("""
+CSS = """
 <style>
 body {background-color: #0b0c0c; color: #cfd2c3; font-family: "Consolas", "Roboto Mono", monospace;}
 h1, h2, h3, h4 {color: #a9df52; text-transform: uppercase; letter-spacing: 1px;}
@@ -24,7 +33,360 @@ div[data-testid="stMetricValue"] {color: #a9df52 !important;}
 @keyframes sweep {from { transform: rotate(0deg); } to { transform: rotate(360deg); }}
 hr, .stDivider {border-top: 1px solid #2f3a2f;}
 </style>
-""", unsafe_allow_html=True)
+"""
+# disuntikkan tiap rerun: elemen yang tidak dipanggil ulang dihapus Streamlit dari halaman
+st.markdown(CSS, unsafe_allow_html=True)
+
+# =====================================
+# 🌐 HTTP SESSION (connection pool dipakai ulang antar-rerun)
+# =====================================
+@st.cache_resource
+def http_session():
+    s = requests.Session()
+    # hanya ulangi 502/503/504; timeout connect/read tidak diulang agar batas timeout tetap berlaku
+    retry = Retry(total=2, connect=0, read=0, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=8, max_retries=retry)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    s.headers.update({"User-Agent": "Mozilla/5.0"})
+    return s
+
+SESSION = http_session()
+
+# =====================================
+# 💾 EKSPOR DATA (dipanggil download_button hanya saat tombol diklik)
+# =====================================
+def df_to_csv(df, dtypes=None, **kwargs):
+    if dtypes:
+        df = df.astype(dtypes)
+    return df.to_csv(index=False, **kwargs).encode()
+
+def df_to_json(df, dtypes=None, **kwargs):
+    if dtypes:
+        df = df.astype(dtypes)
+    return df.to_json(orient="records", **kwargs).encode()
+
+# =====================================
+# 📄 QAM METAR — DATA, PARSER & PDF
+# =====================================
+# --- DATA SOURCES ---
+METAR_API = "https://aviationweather.gov/api/data/metar"
+SATELLITE_HIMA_RIAU = "http://202.90.198.22/IMAGE/HIMA/H08_RP_Riau.png"
+SATELLITE_MAX_BYTES = 4_000_000
+IMAGE_MAGIC = (b"\x89PNG", b"\xff\xd8", b"GIF8")
+
+# --- FETCH METAR ---
+@st.cache_data(ttl=300, show_spinner=False)
+def fetch_metar():
+    r = SESSION.get(METAR_API, params={"ids": "WIBB", "hours": 0}, timeout=10)
+    r.raise_for_status()
+    x = RE_REPORT.search(r.text)
+    return x.group(0).strip() if x else r.text.strip()
+
+@st.cache_data(ttl=300, show_spinner=False)
+def fetch_metar_history(hours=24):
+    r = SESSION.get(METAR_API, params={"ids": "WIBB", "hours": hours}, timeout=10)
+    r.raise_for_status()
+    return r.text.strip().splitlines()
+
+@st.cache_data(ttl=300, show_spinner=False)
+def fetch_metar_ogimet(end, hours=24):
+    start = end - pd.Timedelta(hours=hours)
+    url = "https://www.ogimet.com/display_metars2.php"
+    params = {
+        "lang": "en",
+        "lugar": "WIBB",
+        "tipo": "ALL",
+        "ord": "REV",
+        "nil": "NO",
+        "fmt": "txt",
+        "ano": start.year,
+        "mes": start.month,
+        "day": start.day,
+        "hora": start.hour,
+        "anof": end.year,
+        "mesf": end.month,
+        "dayf": end.day,
+        "horaf": end.hour,
+        "minf": end.minute
+    }
+    r = SESSION.get(url, params=params, timeout=15)
+    r.raise_for_status()
+    return [l.strip() for l in r.text.splitlines() if l.startswith("WIBB")]
+
+@st.cache_resource
+def satellite_store():
+    # {url: (etag, last_modified, content)} dipakai bersama semua sesi untuk conditional GET
+    return {}
+
+@st.cache_data(ttl=600, show_spinner=False)
+def fetch_satellite(url):
+    store = satellite_store()
+    headers = {}
+    etag, modified, content = store.get(url, (None, None, None))
+    if etag:
+        headers["If-None-Match"] = etag
+    if modified:
+        headers["If-Modified-Since"] = modified
+    # connect timeout pendek + batas ukuran agar upstream yang macet/aneh tidak menahan worker
+    with SESSION.get(url, timeout=(3, 10), headers=headers, stream=True) as r:
+        if r.status_code == 304 and content:
+            return content
+        r.raise_for_status()
+        buf = bytearray()
+        for chunk in r.iter_content(65536):
+            buf += chunk
+            if len(buf) > SATELLITE_MAX_BYTES:
+                raise requests.RequestException(f"satellite image exceeds {SATELLITE_MAX_BYTES} bytes")
+        content = bytes(buf)
+        # body 200 yang bukan gambar (halaman error/captive HTML) dianggap gagal → masuk negative cache
+        if not (r.headers.get("Content-Type", "").startswith("image/") or content.startswith(IMAGE_MAGIC)):
+            raise requests.RequestException("satellite response is not an image")
+        store[url] = (r.headers.get("ETag"), r.headers.get("Last-Modified"), content)
+    return content
+
+# --- NEGATIVE CACHE ---
+NEG_TTL = 30  # detik; fetch yang gagal/kosong tidak diulang selama jeda ini
+
+def neg_cached(key):
+    ts = st.session_state.get("_neg_cache", {}).get(key)
+    return ts is not None and time.time() - ts < NEG_TTL
+
+def fetch_all(jobs):
+    # jobs = {key: (fn, *args)}; dijalankan paralel, kecuali yang masih dalam negative cache
+    neg = st.session_state.setdefault("_neg_cache", {})
+    with ThreadPoolExecutor(max_workers=len(jobs)) as ex:
+        futures = {key: ex.submit(*job) for key, job in jobs.items() if not neg_cached(key)}
+    results = dict.fromkeys(jobs)
+    for key, future in futures.items():
+        try:
+            results[key] = future.result()
+        except requests.RequestException:
+            pass
+        if results[key]:
+            neg.pop(key, None)
+        else:
+            neg[key] = time.time()
+    return results
+
+# --- METAR PARSERS ---
+RE_REPORT = re.compile(r'^(?:METAR |SPECI )?WIBB\b[^\n]*', re.MULTILINE)
+RE_TIME = re.compile(r' (\d{2})(\d{2})(\d{2})Z')
+RE_WIND = re.compile(r'(\d{3})(\d{2})KT')
+RE_TD = re.compile(r' (M?\d{2})/(M?\d{2})')
+RE_QNH = re.compile(r' Q(\d{4})')
+RE_VIS = re.compile(r' (\d{4}) ')
+
+def metar_temp(x):
+    d = x[1:] if x.startswith("M") else x
+    return len(d) == 2 and d.isdigit()
+
+@lru_cache(maxsize=4)
+def qam_fields(m):
+    # satu kali split; tiap grup METAR dikenali dari bentuk tokennya (…KT, 4 digit, TT/DD, Q…)
+    # hasil di-cache per string METAR, jadi dict yang dikembalikan hanya untuk dibaca
+    f = {"wind": "-", "vis": "-", "td": "-", "qnh": "-"}
+    for tok in m.split():
+        tok = tok.rstrip("=")
+        if len(tok) == 7 and tok.endswith("KT") and tok[:5].isdigit():
+            if f["wind"] == "-":
+                f["wind"] = f"{tok[:3]}° / {tok[3:5]} kt"
+        elif len(tok) == 4 and tok.isdigit():
+            if f["vis"] == "-":
+                f["vis"] = f"{tok} m"
+        elif len(tok) == 5 and tok[0] == "Q" and tok[1:].isdigit():
+            if f["qnh"] == "-":
+                f["qnh"] = f"{tok[1:]} hPa"
+        elif "/" in tok and f["td"] == "-":
+            t, _, d = tok.partition("/")
+            if metar_temp(t) and metar_temp(d):
+                f["td"] = f"{t} / {d} °C"
+    return f
+
+METAR_DTYPES = {"wind": "Int16", "temp": "Int8", "dew": "Int8", "qnh": "Int16", "vis": "Int16",
+                "RA": "int8", "TS": "int8", "FG": "int8"}
+
+FLAG_COLORS = {"RA": "#00bfff", "TS": "#ff3333", "FG": "#9e9e9e"}
+FLAG_EXPORT = dict.fromkeys(FLAG_COLORS, bool)  # ekspor tetap True/False seperti skema awal
+
+METEOGRAM_PANELS = ["Temperature / Dew Point (°C)", "Wind Speed (kt)", "QNH (hPa)", "Visibility (m)",
+                    "Weather Flags (RA / TS / FG)"]
+
+METEOGRAM_SERIES = [("temp", "Temp", "y"), ("dew", "Dew", "y"), ("wind", "Wind", "y2"),
+                    ("qnh", "QNH", "y3"), ("vis", "Visibility", "y4")]
+MAX_POINTS = 1500  # batas titik per seri yang dikirim ke browser
+
+def lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: pilih satu titik per bucket yang membentuk segitiga terbesar
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    idx = np.empty(n_out, dtype=int)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt = slice(hi, edges[i + 2] if i + 2 < len(edges) else n)
+        cx, cy = x[nxt].mean(), y[nxt].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(area.argmax())
+        idx[i + 1] = a
+    return idx
+
+def downsample(t, y, n_out=MAX_POINTS):
+    if len(y) <= n_out:
+        return t, y
+    keep = y.notna().to_numpy()
+    t, y = t[keep], y[keep]
+    idx = lttb(t.astype("int64").to_numpy(dtype=float), y.to_numpy(dtype=float), n_out)
+    return t.iloc[idx], y.iloc[idx]
+
+def meteogram_layout(gap=0.3 / len(METEOGRAM_PANELS)):
+    # satu sumbu x untuk semua panel; tiap panel mendapat domain y sendiri (jarak = default make_subplots)
+    n = len(METEOGRAM_PANELS)
+    h = (1 - gap * (n - 1)) / n
+    layout = {"height": 950, "hovermode": "x unified", "xaxis": {"anchor": f"y{n}"}, "annotations": []}
+    for i, title in enumerate(METEOGRAM_PANELS):
+        top = 1 - i * (h + gap)
+        layout["yaxis" if i == 0 else f"yaxis{i + 1}"] = {"domain": [top - h, top]}
+        layout["annotations"].append(dict(text=title, x=0.5, y=top, xref="paper", yref="paper",
+                                          xanchor="center", yanchor="bottom", showarrow=False, font={"size": 16}))
+    layout[f"yaxis{n}"].update(type="category", categoryorder="array", categoryarray=list(FLAG_COLORS))
+    return layout
+
+# figure hanya dibangun ulang bila data berubah; objek yang di-cache tidak dimodifikasi setelahnya
+@st.cache_resource(max_entries=4, show_spinner=False)
+def meteogram_figure(df):
+    traces = []
+    for col, name, axis in METEOGRAM_SERIES:
+        # kolom nullable (Int8/Int16) dikirim sebagai float32 agar nilai kosong menjadi NaN
+        x, y = downsample(df["time"], df[col].astype("float32"))
+        traces.append(go.Scattergl(x=x, y=y, name=name, yaxis=axis))
+    flags = df.melt(id_vars="time", value_vars=list(FLAG_COLORS), var_name="flag")
+    flags = flags[flags["value"] == 1]
+    traces.append(go.Scattergl(x=flags["time"], y=flags["flag"], mode="markers", name="RA / TS / FG",
+                               marker=dict(color=flags["flag"].map(FLAG_COLORS)), yaxis="y5"))
+    # satu konstruksi Figure, tanpa validasi ulang per add_trace
+    return go.Figure(data=traces, layout=meteogram_layout())
+
+def metar_int(s):
+    return pd.to_numeric(s.str.replace("M", "-", regex=False), errors="coerce")
+
+@st.cache_data(ttl=300, show_spinner=False)
+def build_history_df(raw):
+    # AviationWeather & OGIMET (ord=REV) mengirim data terbaru lebih dulu
+    s = pd.Series(raw[::-1], dtype=object)
+    t = s.str.extract(RE_TIME).apply(pd.to_numeric)
+    # METAR hanya memuat tanggal/jam/menit; tahun & bulan diambil dari waktu sekarang
+    ref = datetime.now(timezone.utc)
+    prev = ref.replace(day=1) - pd.Timedelta(days=1)
+    rollback = t[0] > ref.day
+    time = pd.to_datetime(pd.DataFrame({
+        "year": np.where(rollback, prev.year, ref.year),
+        "month": np.where(rollback, prev.month, ref.month),
+        "day": t[0], "hour": t[1], "minute": t[2],
+    }), errors="coerce", utc=True)
+    td = s.str.extract(RE_TD)
+    df = pd.DataFrame({
+        "time": time,
+        "wind": metar_int(s.str.extract(RE_WIND)[1]),
+        "temp": metar_int(td[0]),
+        "dew": metar_int(td[1]),
+        "qnh": metar_int(s.str.extract(RE_QNH)[0]),
+        "vis": metar_int(s.str.extract(RE_VIS)[0]),
+        **{f: s.str.contains(f, regex=False) for f in FLAG_COLORS},
+    })
+    return df.dropna(subset=["time"]).astype(METAR_DTYPES).reset_index(drop=True)
+
+# --- PDF GENERATOR ---
+PDF_ESC = str.maketrans({"\\": "\\\\", "(": "\\(", ")": "\\)"})
+PDF_HEAD = (b"%PDF-1.4\n1 0 obj<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>endobj\n"
+            b"2 0 obj<< /Length ")
+PDF_TAIL = (b"\nendstream endobj\n3 0 obj<< /Type /Page /Parent 4 0 R /Contents 2 0 R "
+            b"/Resources<< /Font<< /F1 1 0 R >> >> >>endobj\n4 0 obj<< /Type /Pages /Kids [3 0 R] /Count 1 "
+            b"/MediaBox [0 0 595 842] >>endobj\n5 0 obj<< /Type /Catalog /Pages 4 0 R >>endobj\nxref\n0 6\n0000000000 65535 f \n"
+            b"trailer<< /Size 6 /Root 5 0 R >>\n%%EOF")
+
+# isi QAM hanya berubah bila METAR atau menit laporan berubah
+@st.cache_data(max_entries=16, show_spinner=False)
+def generate_pdf(lines):
+    parts = ["BT\n/F1 10 Tf\n72 800 Td\n"]
+    for l in lines:
+        parts.append(f"({l.translate(PDF_ESC)}) Tj\n0 -14 Td\n")
+    parts.append("ET")
+    content = "".join(parts).encode()
+    return b"".join((PDF_HEAD, str(len(content)).encode(), b" >>stream\n", content, PDF_TAIL))
+
+# =====================================
+# 🛰️ BMKG FORECAST — API & FLATTEN
+# =====================================
+API_BASE = "https://cuaca.bmkg.go.id/api/df/v1/forecast/adm"
+MS_TO_KT = 1.94384  # konversi ke knot
+
+@st.cache_data(ttl=300)
+def fetch_forecast(adm1: str):
+    params = {"adm1": adm1}
+    resp = SESSION.get(API_BASE, params=params, timeout=10)
+    resp.raise_for_status()
+    return resp.json()
+
+@st.cache_data(ttl=300, show_spinner=False)
+def flatten_cuaca_entry(entry):
+    lokasi = entry.get("lokasi", {})
+    df = pd.json_normalize([obs for group in entry.get("cuaca", []) for obs in group], max_level=0)
+    if df.empty:
+        return df
+    df = df.assign(**{k: lokasi.get(k) for k in ("adm1", "adm2", "provinsi", "kotkab", "lon", "lat")})
+    df["utc_datetime_dt"] = pd.to_datetime(df.get("utc_datetime"), errors="coerce")
+    df["local_datetime_dt"] = pd.to_datetime(df.get("local_datetime"), errors="coerce")
+    for c in ["t", "tcc", "tp", "wd_deg", "ws", "hu", "vs"]:
+        if c in df.columns:
+            # kolom bilangan bulat kecil (suhu, %, derajat, meter) cukup int8/int16;
+            # ws/tp tetap float64 agar tabel & ekspor tidak membawa noise float32
+            df[c] = pd.to_numeric(df[c], errors="coerce", downcast=None if c in ("ws", "tp") else "integer")
+    # konversi knot & urutan waktu ikut di-cache bersama hasil flatten
+    df["ws_kt"] = df["ws"] * MS_TO_KT
+    return df.sort_values("utc_datetime_dt")
+
+# grafik tren hanya dibangun ulang bila potongan data (lokasi/rentang waktu) berubah
+@st.cache_resource(max_entries=8, show_spinner=False)
+def trend_figures(df):
+    x = "local_datetime_dt"
+    return (
+        px.line(df, x=x, y="t", title="Temperature (°C)", markers=True, render_mode="webgl",
+                color_discrete_sequence=["#a9df52"]),
+        px.line(df, x=x, y="hu", title="Humidity (%)", markers=True, render_mode="webgl",
+                color_discrete_sequence=["#00ffbf"]),
+        px.line(df, x=x, y="ws_kt", title="Wind Speed (KT)", markers=True, render_mode="webgl",
+                color_discrete_sequence=["#00ffbf"]),
+        px.bar(df, x=x, y="tp", title="Rainfall (mm)", color_discrete_sequence=["#ffbf00"]),
+    )
+
+WINDROSE_DIRS = np.arange(0, 360, 22.5)  # pusat sektor N, NNE, ..., NNW
+WINDROSE_SPEEDS = [0, 5, 10, 20, 30, 50, 100]
+WINDROSE_CLASSES = ["<5", "5–10", "10–20", "20–30", "30–50", ">50"]
+WINDROSE_COLORS = ["#00ffbf", "#80ff00", "#d0ff00", "#ffb300", "#ff6600", "#ff0033"]
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def windrose_figure(wd, ws):
+    # geser setengah sektor agar N mencakup 348.75°–11.25° dalam satu bin
+    counts, _, _ = np.histogram2d((wd + 11.25) % 360, ws, bins=[np.append(WINDROSE_DIRS, 360), WINDROSE_SPEEDS])
+    percent = counts / counts.sum() * 100
+    fig = go.Figure([
+        go.Barpolar(r=percent[:, i], theta=WINDROSE_DIRS, name=f"{sc} KT", marker_color=WINDROSE_COLORS[i], opacity=0.85)
+        for i, sc in enumerate(WINDROSE_CLASSES)
+    ])
+    fig.update_layout(
+        title="Windrose (KT)",
+        polar=dict(
+            angularaxis=dict(direction="clockwise", rotation=90, tickvals=list(range(0,360,45))),
+            radialaxis=dict(ticksuffix="%", showline=True, gridcolor="#333")
+        ),
+        legend_title="Wind Speed Class",
+        template="plotly_dark"
+    )
+    return fig
 
 # =====================================
 # 🔹 TAB NAVIGASI
@@ -38,205 +400,85 @@ with tab1:
     st.title("QAM METEOROLOGICAL REPORT")
     st.subheader("Lanud Roesmin Nurjadin — WIBB")
 
-    # --- DATA SOURCES ---
-    METAR_API = "https://aviationweather.gov/api/data/metar"
-    SATELLITE_HIMA_RIAU = "http://202.90.198.22/IMAGE/HIMA/H08_RP_Riau.png"
-
-    # --- FETCH METAR ---
-    def fetch_metar():
-        r = requests.get(METAR_API, params={"ids": "WIBB", "hours": 0}, timeout=10)
-        r.raise_for_status()
-        return r.text.strip()
-
-    def fetch_metar_history(hours=24):
-        r = requests.get(METAR_API, params={"ids": "WIBB", "hours": hours}, timeout=10)
-        r.raise_for_status()
-        return r.text.strip().splitlines()
-
-    def fetch_metar_ogimet(hours=24):
-        end = datetime.utcnow()
-        start = end - pd.Timedelta(hours=hours)
-        url = "https://www.ogimet.com/display_metars2.php"
-        params = {
-            "lang": "en",
-            "lugar": "WIBB",
-            "tipo": "ALL",
-            "ord": "REV",
-            "nil": "NO",
-            "fmt": "txt",
-            "ano": start.year,
-            "mes": start.month,
-            "day": start.day,
-            "hora": start.hour,
-            "anof": end.year,
-            "mesf": end.month,
-            "dayf": end.day,
-            "horaf": end.hour,
-            "minf": end.minute
-        }
-        r = requests.get(url, params=params, timeout=15)
-        r.raise_for_status()
-        return [l.strip() for l in r.text.splitlines() if l.startswith("WIBB")]
-
-    # --- METAR PARSERS ---
-    def wind(m):
-        x = re.search(r'(\d{3})(\d{2})KT', m)
-        return f"{x.group(1)}° / {x.group(2)} kt" if x else "-"
-
-    def visibility(m):
-        x = re.search(r' (\d{4}) ', m)
-        return f"{x.group(1)} m" if x else "-"
-
-    def temp_dew(m):
-        x = re.search(r' (M?\d{2})/(M?\d{2})', m)
-        return f"{x.group(1)} / {x.group(2)} °C" if x else "-"
-
-    def qnh(m):
-        x = re.search(r' Q(\d{4})', m)
-        return f"{x.group(1)} hPa" if x else "-"
-
-    def parse_numeric_metar(m):
-        t = re.search(r' (\d{2})(\d{2})(\d{2})Z', m)
-        if not t: return None
-        data = {"time": datetime.strptime(t.group(0).strip(), "%d%H%MZ"),
-                "wind": None, "temp": None, "dew": None, "qnh": None, "vis": None,
-                "RA": "RA" in m, "TS": "TS" in m, "FG": "FG" in m}
-        w = re.search(r'(\d{3})(\d{2})KT', m)
-        if w: data["wind"] = int(w.group(2))
-        td = re.search(r' (M?\d{2})/(M?\d{2})', m)
-        if td:
-            data["temp"] = int(td.group(1).replace("M", "-"))
-            data["dew"] = int(td.group(2).replace("M", "-"))
-        q = re.search(r' Q(\d{4})', m)
-        if q: data["qnh"] = int(q.group(1))
-        v = re.search(r' (\d{4}) ', m)
-        if v: data["vis"] = int(v.group(1))
-        return data
-
-    # --- PDF GENERATOR ---
-    def generate_pdf(lines):
-        content = "BT\n/F1 10 Tf\n72 800 Td\n"
-        for l in lines:
-            safe = l.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
-            content += f"({safe}) Tj\n0 -14 Td\n"
-        content += "ET"
-        return (
-            b"%PDF-1.4\n1 0 obj<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>endobj\n"
-            b"2 0 obj<< /Length " + str(len(content)).encode() +
-            b" >>stream\n" + content.encode() +
-            b"\nendstream endobj\n3 0 obj<< /Type /Page /Parent 4 0 R /Contents 2 0 R "
-            b"/Resources<< /Font<< /F1 1 0 R >> >> >>endobj\n4 0 obj<< /Type /Pages /Kids [3 0 R] /Count 1 "
-            b"/MediaBox [0 0 595 842] >>endobj\n5 0 obj<< /Type /Catalog /Pages 4 0 R >>endobj\nxref\n0 6\n0000000000 65535 f \n"
-            b"trailer<< /Size 6 /Root 5 0 R >>\n%%EOF"
-        )
-
-    now = datetime.now(timezone.utc).strftime("%d %b %Y %H%M UTC")
-    metar = fetch_metar()
+    fetched = fetch_all({
+        "metar": (fetch_metar,),
+        "history": (fetch_metar_history, 24),
+        "satellite": (fetch_satellite, SATELLITE_HIMA_RIAU),
+    })
+
+    # satu waktu acuan per rerun untuk header QAM dan parameter OGIMET
+    utc_now = datetime.now(timezone.utc)
+    now = utc_now.strftime("%d %b %Y %H%M UTC")
+    metar = fetched["metar"] or ""
+    if not metar:
+        st.warning("METAR temporarily unavailable.")
+    fields = qam_fields(metar)
     qam_text = [
         "METEOROLOGICAL REPORT (QAM)",
         f"DATE / TIME (UTC) : {now}",
         "AERODROME        : WIBB",
-        f"SURFACE WIND     : {wind(metar)}",
-        f"VISIBILITY       : {visibility(metar)}",
-        f"TEMP / DEWPOINT  : {temp_dew(metar)}",
-        f"QNH              : {qnh(metar)}",
+        f"SURFACE WIND     : {fields['wind']}",
+        f"VISIBILITY       : {fields['vis']}",
+        f"TEMP / DEWPOINT  : {fields['td']}",
+        f"QNH              : {fields['qnh']}",
         "",
         "RAW METAR:",
         metar
     ]
 
-    st.download_button("⬇️ Download QAM (PDF)", data=generate_pdf(qam_text), file_name="QAM_WIBB.pdf", mime="application/pdf")
-    st.code(metar)
+    # klik download hanya menjalankan ulang fragment ini, bukan seluruh tab
+    @st.fragment
+    def qam_section(metar, qam_text):
+        st.download_button("⬇️ Download QAM (PDF)", data=generate_pdf(tuple(qam_text)), file_name="QAM_WIBB.pdf", mime="application/pdf")
+        st.code(metar)
+
+    qam_section(metar, qam_text)
 
     st.divider()
     st.subheader("🛰️ Weather Satellite — Himawari-8 (Infrared)")
     st.caption("BMKG Himawari-8 | Reference only — not for tactical separation")
-    try:
-        img = requests.get(SATELLITE_HIMA_RIAU, timeout=10, headers={"User-Agent": "Mozilla/5.0"})
-        img.raise_for_status()
-        st.image(img.content, use_container_width=True)
-    except Exception:
+    if not fetched["satellite"]:
         st.warning("Satellite imagery temporarily unavailable.")
+    else:
+        try:
+            st.image(fetched["satellite"], use_container_width=True)
+        except Exception:
+            st.warning("Satellite imagery temporarily unavailable.")
 
     st.divider()
     st.subheader("📊 Historical METAR Meteogram — Last 24h")
-    raw = fetch_metar_history(24)
+    raw = fetched["history"] or []
     source = "AviationWeather.gov"
-    if not raw or len(raw) < 2:
-        raw = fetch_metar_ogimet(24)
+    if len(raw) < 2:
+        # akhir rentang dibulatkan ke 10 menit agar cache OGIMET tetap kena antar-rerun
+        end = utc_now.replace(minute=utc_now.minute // 10 * 10, second=0, microsecond=0)
+        raw = fetch_all({"ogimet": (fetch_metar_ogimet, end, 24)})["ogimet"] or []
         source = "OGIMET Archive"
-    df = pd.DataFrame([parse_numeric_metar(m) for m in raw if parse_numeric_metar(m)])
+    df = build_history_df(tuple(raw))
     st.caption(f"Data source: {source} | Records: {len(df)}")
 
-    if not df.empty:
-        df.sort_values("time", inplace=True)
-        fig = make_subplots(
-            rows=5, cols=1, shared_xaxes=True,
-            subplot_titles=["Temperature / Dew Point (°C)","Wind Speed (kt)","QNH (hPa)","Visibility (m)","Weather Flags (RA / TS / FG)"]
-        )
-        fig.add_trace(go.Scatter(x=df["time"], y=df["temp"], name="Temp"), 1, 1)
-        fig.add_trace(go.Scatter(x=df["time"], y=df["dew"], name="Dew"), 1, 1)
-        fig.add_trace(go.Scatter(x=df["time"], y=df["wind"], name="Wind"), 2, 1)
-        fig.add_trace(go.Scatter(x=df["time"], y=df["qnh"], name="QNH"), 3, 1)
-        fig.add_trace(go.Scatter(x=df["time"], y=df["vis"], name="Visibility"), 4, 1)
-        fig.add_trace(go.Scatter(x=df["time"], y=df["RA"].astype(int), mode="markers", name="RA"), 5, 1)
-        fig.add_trace(go.Scatter(x=df["time"], y=df["TS"].astype(int), mode="markers", name="TS"), 5, 1)
-        fig.add_trace(go.Scatter(x=df["time"], y=df["FG"].astype(int), mode="markers", name="FG"), 5, 1)
-        fig.update_layout(height=950, hovermode="x unified")
-        st.plotly_chart(fig, use_container_width=True)
+    @st.fragment
+    def history_section(df):
+        if not df.empty:
+            if not df["time"].is_monotonic_increasing:
+                df = df.sort_values("time")
+            st.plotly_chart(meteogram_figure(df), use_container_width=True)
 
-    st.divider()
-    st.subheader("📥 Download Historical METAR Data")
-    if not df.empty:
-        df["time"] = df["time"].dt.strftime("%Y-%m-%dT%H:%M:%SZ")
-        st.download_button("⬇️ Download CSV", df.to_csv(index=False), "WIBB_METAR_24H.csv")
-        st.download_button("⬇️ Download JSON", df.to_json(orient="records"), "WIBB_METAR_24H.json")
+        st.divider()
+        st.subheader("📥 Download Historical METAR Data")
+        if not df.empty:
+            # format waktu diserahkan ke writer pandas; kolom time tidak disalin atau diubah
+            csv = partial(df_to_csv, df, FLAG_EXPORT, date_format="%Y-%m-%dT%H:%M:%SZ")
+            json_text = partial(df_to_json, df, FLAG_EXPORT, date_format="iso", date_unit="s")
+            st.download_button("⬇️ Download CSV", csv, "WIBB_METAR_24H.csv")
+            st.download_button("⬇️ Download JSON", json_text, "WIBB_METAR_24H.json")
+
+    history_section(df)
 
 # =====================================
 # TAB 2: BMKG Tactical Forecast
 # =====================================
 with tab2:
-    # =====================================
-    # ⚙️ KONFIGURASI DASAR
-    # =====================================
-    st.set_page_config(page_title="Tactical Weather Ops — BMKG", layout="wide")
-
-    API_BASE = "https://cuaca.bmkg.go.id/api/df/v1/forecast/adm"
-    MS_TO_KT = 1.94384  # konversi ke knot
-
-    @st.cache_data(ttl=300)
-    def fetch_forecast(adm1: str):
-        params = {"adm1": adm1}
-        resp = requests.get(API_BASE, params=params, timeout=10)
-        resp.raise_for_status()
-        return resp.json()
-
-    def flatten_cuaca_entry(entry):
-        rows = []
-        lokasi = entry.get("lokasi", {})
-        for group in entry.get("cuaca", []):
-            for obs in group:
-                r = obs.copy()
-                r.update({
-                    "adm1": lokasi.get("adm1"),
-                    "adm2": lokasi.get("adm2"),
-                    "provinsi": lokasi.get("provinsi"),
-                    "kotkab": lokasi.get("kotkab"),
-                    "lon": lokasi.get("lon"),
-                    "lat": lokasi.get("lat"),
-                })
-                try:
-                    r["utc_datetime_dt"] = pd.to_datetime(r.get("utc_datetime"))
-                    r["local_datetime_dt"] = pd.to_datetime(r.get("local_datetime"))
-                except Exception:
-                    r["utc_datetime_dt"], r["local_datetime_dt"] = pd.NaT, pd.NaT
-                rows.append(r)
-        df = pd.DataFrame(rows)
-        for c in ["t", "tcc", "tp", "wd_deg", "ws", "hu", "vs"]:
-            if c in df.columns:
-                df[c] = pd.to_numeric(df[c], errors="coerce")
-        return df
-
     # =====================================
     # SIDEBAR
     # =====================================
@@ -288,112 +530,86 @@ with tab2:
         st.warning("No valid weather data found.")
         st.stop()
 
-    df["ws_kt"] = df["ws"] * MS_TO_KT
-    df = df.sort_values("utc_datetime_dt")
+    # slider & semua grafik di bawahnya dijalankan ulang sendiri tanpa memproses ulang bagian atas tab;
+    # slider berada di badan halaman karena fragment tidak dapat menulis ke sidebar
+    @st.fragment
+    def tactical_view(df, selected_entry):
+        min_dt = df["local_datetime_dt"].dropna().min().to_pydatetime()
+        max_dt = df["local_datetime_dt"].dropna().max().to_pydatetime()
+
+        start_dt = st.slider(
+            "Time Range (Local)",
+            min_value=min_dt,
+            max_value=max_dt,
+            value=(min_dt, max_dt),
+            step=pd.Timedelta(hours=3)
+        )
 
-    min_dt = df["local_datetime_dt"].dropna().min().to_pydatetime()
-    max_dt = df["local_datetime_dt"].dropna().max().to_pydatetime()
+        mask = (df["local_datetime_dt"] >= pd.to_datetime(start_dt[0])) & \
+               (df["local_datetime_dt"] <= pd.to_datetime(start_dt[1]))
+        df_sel = df.loc[mask]
 
-    start_dt = st.sidebar.slider(
-        "Time Range (Local)",
-        min_value=min_dt,
-        max_value=max_dt,
-        value=(min_dt, max_dt),
-        step=pd.Timedelta(hours=3)
-    )
-
-    mask = (df["local_datetime_dt"] >= pd.to_datetime(start_dt[0])) & \
-           (df["local_datetime_dt"] <= pd.to_datetime(start_dt[1]))
-    df_sel = df.loc[mask].copy()
-
-    # Metrics
-    st.markdown("---")
-    st.subheader("⚡ Tactical Weather Status")
-    now = df_sel.iloc[0]
-    c1, c2, c3, c4 = st.columns(4)
-    with c1: st.metric("TEMP (°C)", f"{now.get('t', '—')}°C")
-    with c2: st.metric("HUMIDITY", f"{now.get('hu', '—')}%")
-    with c3: st.metric("WIND (KT)", f"{now.get('ws_kt', 0):.1f}")
-    with c4: st.metric("RAIN (mm)", f"{now.get('tp', '—')}")
-
-    # Trends
-    st.markdown("---")
-    st.subheader("📊 Parameter Trends")
-    c1, c2 = st.columns(2)
-    with c1:
-        st.plotly_chart(px.line(df_sel, x="local_datetime_dt", y="t",
-            title="Temperature (°C)", markers=True, color_discrete_sequence=["#a9df52"]), use_container_width=True)
-        st.plotly_chart(px.line(df_sel, x="local_datetime_dt", y="hu",
-            title="Humidity (%)", markers=True, color_discrete_sequence=["#00ffbf"]), use_container_width=True)
-    with c2:
-        st.plotly_chart(px.line(df_sel, x="local_datetime_dt", y="ws_kt",
-            title="Wind Speed (KT)", markers=True, color_discrete_sequence=["#00ffbf"]), use_container_width=True)
-        st.plotly_chart(px.bar(df_sel, x="local_datetime_dt", y="tp",
-            title="Rainfall (mm)", color_discrete_sequence=["#ffbf00"]), use_container_width=True)
-
-    # Windrose
-    st.markdown("---")
-    st.subheader("🌪️ Windrose — Direction & Speed")
-    if "wd_deg" in df_sel.columns and "ws_kt" in df_sel.columns:
-        df_wr = df_sel.dropna(subset=["wd_deg", "ws_kt"])
-        if not df_wr.empty:
-            bins_dir = np.arange(-11.25, 360, 22.5)
-            labels_dir = ["N","NNE","NE","ENE","E","ESE","SE","SSE","S","SSW","SW","WSW","W","WNW","NW","NNW"]
-            df_wr["dir_sector"] = pd.cut(df_wr["wd_deg"] % 360, bins=bins_dir, labels=labels_dir, include_lowest=True)
-            speed_bins = [0,5,10,20,30,50,100]
-            speed_labels = ["<5","5–10","10–20","20–30","30–50",">50"]
-            df_wr["speed_class"] = pd.cut(df_wr["ws_kt"], bins=speed_bins, labels=speed_labels, include_lowest=True)
-            freq = df_wr.groupby(["dir_sector","speed_class"]).size().reset_index(name="count")
-            freq["percent"] = freq["count"]/freq["count"].sum()*100
-            az_map = {"N":0,"NNE":22.5,"NE":45,"ENE":67.5,"E":90,"ESE":112.5,"SE":135,"SSE":157.5,
-                      "S":180,"SSW":202.5,"SW":225,"WSW":247.5,"W":270,"WNW":292.5,"NW":315,"NNW":337.5}
-            freq["theta"] = freq["dir_sector"].map(az_map)
-            colors = ["#00ffbf","#80ff00","#d0ff00","#ffb300","#ff6600","#ff0033"]
-            fig_wr = go.Figure()
-            for i, sc in enumerate(speed_labels):
-                subset = freq[freq["speed_class"]==sc]
-                fig_wr.add_trace(go.Barpolar(
-                    r=subset["percent"], theta=subset["theta"],
-                    name=f"{sc} KT", marker_color=colors[i], opacity=0.85
-                ))
-            fig_wr.update_layout(
-                title="Windrose (KT)",
-                polar=dict(
-                    angularaxis=dict(direction="clockwise", rotation=90, tickvals=list(range(0,360,45))),
-                    radialaxis=dict(ticksuffix="%", showline=True, gridcolor="#333")
-                ),
-                legend_title="Wind Speed Class",
-                template="plotly_dark"
-            )
-            st.plotly_chart(fig_wr, use_container_width=True)
-
-    # Map
-    if show_map:
+        # Metrics
         st.markdown("---")
-        st.subheader("🗺️ Tactical Map")
-        try:
-            lat = float(selected_entry.get("lokasi", {}).get("lat", 0))
-            lon = float(selected_entry.get("lokasi", {}).get("lon", 0))
-            st.map(pd.DataFrame({"lat": [lat], "lon": [lon]}))
-        except Exception as e:
-            st.warning(f"Map unavailable: {e}")
-
-    # Table
-    if show_table:
+        st.subheader("⚡ Tactical Weather Status")
+        # ambil skalar per kolom, tanpa membentuk Series satu baris
+        now = {c: df_sel[c].iat[0] for c in ("t", "hu", "ws_kt", "tp") if c in df_sel.columns}
+        c1, c2, c3, c4 = st.columns(4)
+        with c1: st.metric("TEMP (°C)", f"{now.get('t', '—')}°C")
+        with c2: st.metric("HUMIDITY", f"{now.get('hu', '—')}%")
+        with c3: st.metric("WIND (KT)", f"{now.get('ws_kt', 0):.1f}")
+        with c4: st.metric("RAIN (mm)", f"{now.get('tp', '—')}")
+
+        # Trends
+        st.markdown("---")
+        st.subheader("📊 Parameter Trends")
+        fig_t, fig_hu, fig_ws, fig_tp = trend_figures(df_sel)
+        c1, c2 = st.columns(2)
+        with c1:
+            st.plotly_chart(fig_t, use_container_width=True)
+            st.plotly_chart(fig_hu, use_container_width=True)
+        with c2:
+            st.plotly_chart(fig_ws, use_container_width=True)
+            st.plotly_chart(fig_tp, use_container_width=True)
+
+        # Windrose
+        st.markdown("---")
+        st.subheader("🌪️ Windrose — Direction & Speed")
+        if "wd_deg" in df_sel.columns and "ws_kt" in df_sel.columns:
+            df_wr = df_sel.dropna(subset=["wd_deg", "ws_kt"])
+            if not df_wr.empty:
+                st.plotly_chart(windrose_figure(df_wr["wd_deg"].to_numpy(), df_wr["ws_kt"].to_numpy()),
+                                use_container_width=True)
+
+        # Map
+        if show_map:
+            st.markdown("---")
+            st.subheader("🗺️ Tactical Map")
+            try:
+                lat = float(selected_entry.get("lokasi", {}).get("lat", 0))
+                lon = float(selected_entry.get("lokasi", {}).get("lon", 0))
+                st.map(pd.DataFrame({"lat": [lat], "lon": [lon]}))
+            except Exception as e:
+                st.warning(f"Map unavailable: {e}")
+
+        # Table
+        if show_table:
+            st.markdown("---")
+            st.subheader("📋 Forecast Table")
+            st.dataframe(df_sel)
+
+        # Export
         st.markdown("---")
-        st.subheader("📋 Forecast Table")
-        st.dataframe(df_sel)
-
-    # Export
-    st.markdown("---")
-    st.subheader("💾 Export Data")
-    csv = df_sel.to_csv(index=False)
-    json_text = df_sel.to_json(orient="records", force_ascii=False, date_format="iso")
-    c1, c2 = st.columns(2)
-    with c1:
-        st.download_button("⬇️ Download CSV", data=csv, file_name=f"{adm1}_{loc_choice}.csv", mime="text/csv")
-    with c2:
-        st.download_button("⬇️ Download JSON", data=json_text, file_name=f"{adm1}_{loc_choice}.json", mime="application/json")
+        st.subheader("💾 Export Data")
+        csv = partial(df_to_csv, df_sel)
+        json_text = partial(df_to_json, df_sel, force_ascii=False, date_format="iso")
+        c1, c2 = st.columns(2)
+        with c1:
+            st.download_button("⬇️ Download CSV", data=csv, file_name=f"{adm1}_{loc_choice}.csv", mime="text/csv")
+        with c2:
+            st.download_button("⬇️ Download JSON", data=json_text, file_name=f"{adm1}_{loc_choice}.json", mime="application/json")
+
+    tactical_view(df, selected_entry)
 
     # Footer
     st.markdown("""